@@ -1,16 +1,41 @@
-import RPi.GPIO as GPIO
-from time import sleep, time
+import lgpio
+import pigpio
+from time import sleep, perf_counter_ns, monotonic, monotonic_ns
 import board
 import busio
 from adafruit_nunchuk import Nunchuk
 import sys
 import threading
+import collections
+import queue
 import os
+import ctypes
+import mmap
+import struct
+import signal
+from fractions import Fraction
 
 # Motor constants and GPIO setup
 STEPS_PER_REV = 800    # Changed from 200 to 800 for 1/4 microstepping
 MAX_STEPS = 1320000      # Limit
-DEAD_ZONE = 10          # Joystick dead zone
+DEAD_ENTER = 12         # Joystick offset needed to start moving
+DEAD_EXIT = 8           # Joystick offset below which a running motor stops
+NUNCHUK_POLL_INTERVAL = 0.005  # Background nunchuk sampling period
+JOYSTICK_AVERAGE_SAMPLES = 8   # Moving average length for the joystick X axis
+CALIBRATION_SAMPLES = 32       # Readings averaged for the joystick centre
+
+# Step timing (seconds)
+STEP_PULSE_US = 2            # STEP high time in microseconds, driver minimum is ~1.9
+MANUAL_BASE_DELAY = 0.001    # Step period at speed 1.0, shared by manual and joystick moves
+MANUAL_MIN_DELAY = 0.0001    # Fastest manual step period
+HOMING_SPEED = 0.5           # move_steps speed used to return to position 0
+PROGRESS_STEPS = 10000       # Progress report interval for verbose moves
+ENABLE_IDLE_TIMEOUT = 30.0   # Keep the driver energised this long after the last move
+JOYSTICK_MIN_DELAY = 0.0002  # Increased from 0.0001 for more reliable operation
+JOYSTICK_MAX_DELAY = 0.02    # Reduced from 0.03 for better half-speed motion
+JOYSTICK_POLL_INTERVAL = 0.01  # Joystick sampling period while the motor runs
+JOYSTICK_LIMIT_MARGIN = 0.1  # Stop this many seconds of travel short of MAX_STEPS
+JOYSTICK_LUT_SIZE = 256      # Precomputed step rates per joystick deflection
 
 # GPIO pins
 DIR_PIN = 13
@@ -20,34 +45,52 @@ MODE_PIN_1 = 16
 MODE_PIN_2 = 17
 MODE_PIN_3 = 20
 PWM_PIN = 18 # PWM pin for reduced holding current
+STEP_MASK = 1 << STEP_PIN # pigpio wave bit for STEP_PIN
+
+# Set up GPIO through the gpiochip character device (STEP_PIN belongs to pigpio below)
+gpio_chip = lgpio.gpiochip_open(0)
+lgpio.gpio_claim_output(gpio_chip, DIR_PIN, 0)
+lgpio.gpio_claim_output(gpio_chip, ENABLE_PIN, 0) # PWM controls enable
+lgpio.gpio_claim_output(gpio_chip, PWM_PIN, 0) # PWM pin setup
 
-# Set up GPIO
-GPIO.setmode(GPIO.BCM)
-GPIO.setup(DIR_PIN, GPIO.OUT)
-GPIO.setup(STEP_PIN, GPIO.OUT)
-GPIO.setup(ENABLE_PIN, GPIO.OUT) # PWM controls enable
-GPIO.setup(MODE_PIN_1, GPIO.OUT)
-GPIO.setup(MODE_PIN_2, GPIO.OUT)
-GPIO.setup(MODE_PIN_3, GPIO.OUT)
-GPIO.setup(PWM_PIN, GPIO.OUT) # PWM pin setup
-
-# Set 1/4 step mode (Mode1=LOW, Mode2=HIGH, Mode3=LOW)
-GPIO.output(MODE_PIN_1, GPIO.LOW)
-GPIO.output(MODE_PIN_2, GPIO.HIGH)
-GPIO.output(MODE_PIN_3, GPIO.LOW)
-
-# PWM setup
-PWM_FREQUENCY = 1000 # Increased PWM frequency
-pwm = GPIO.PWM(PWM_PIN, PWM_FREQUENCY) # frequency
-pwm.start(0) # Start with 0% duty cycle
+# Set 1/4 step mode (Mode1=LOW, Mode2=HIGH, Mode3=LOW), all three pins in one request
+MODE_QUARTER = [0, 1, 0]
+lgpio.group_claim_output(gpio_chip, [MODE_PIN_1, MODE_PIN_2, MODE_PIN_3], MODE_QUARTER)
 
 # Current Limit (adjust to 80% of rated current)
 CURRENT_LIMIT = 1.6 # Amps (80% of 2.0A)
 
+# pigpio daemon connection, STEP pulses are timed by its DMA wave generator
+pi = pigpio.pi()
+if not pi.connected:
+    print("Failed to connect to pigpio daemon (is pigpiod running?)")
+    lgpio.gpiochip_close(gpio_chip)
+    sys.exit(1)
+pi.set_mode(STEP_PIN, pigpio.OUTPUT)
+WAVE_CHUNK_STEPS = 65535  # Max steps per wave_chain loop (16-bit repeat count)
+pi.wave_clear()
+step_waves = {}  # (high_us, low_us) -> prebuilt single-step wave id
+SPIN_THRESHOLD_NS = 2_000_000  # Waits shorter than this are busy-waited instead of slept
+
+# Hardware PWM state for continuous joystick stepping
+pwm_step_freq = 0       # Active STEP frequency in Hz, 0 when stopped
+pwm_step_direction = 0
+pwm_step_start_ns = 0   # monotonic_ns() when the current frequency started
+pwm_steps_counted = 0   # Steps at that frequency already added to current_position
+limit_reported = False  # The joystick limit message was printed and the stick has not left the limit
+
+# Real-time scheduling (needs root; best with kernel cmdline "isolcpus=3 nohz_full=3 rcu_nocbs=3")
+RT_PRIORITY = 80  # SCHED_FIFO priority
+RT_CPU = 3        # Isolated core for the stepping process
+MCL_CURRENT_FUTURE = 3  # mlockall(MCL_CURRENT | MCL_FUTURE)
+
 # Ensure the stepper_data directory exists
 stepper_data_dir = os.path.expanduser("~/stepper_data")
 os.makedirs(stepper_data_dir, exist_ok=True)
-position_file = os.path.join(stepper_data_dir, "step_position.txt")
+position_file = os.path.join(stepper_data_dir, "step_position.bin")
+legacy_position_file = os.path.join(stepper_data_dir, "step_position.txt")
+POSITION_FORMAT = "<q"  # Fixed-width slot: little-endian int64
+POSITION_SIZE = struct.calcsize(POSITION_FORMAT)
 
 # Constants for conversion
 STEPS_PER_REV_CALC = int(800 * 10 * 0.96)  # Changed from 200 to 800 for 1/4 microstepping
@@ -55,27 +98,87 @@ LEAD_SCREW_TRAVEL_PER_REV = 8  # 8mm per full revolution
 STEPS_PER_MM = STEPS_PER_REV_CALC / LEAD_SCREW_TRAVEL_PER_REV  # Steps per mm
 ARCSECONDS_PER_MM = (3600 * 360) / (LEAD_SCREW_TRAVEL_PER_REV * 45)  # Arcseconds per mm
 STEPS_PER_ARCSECOND = STEPS_PER_MM / ARCSECONDS_PER_MM  # Steps per arcsecond
+# Exact integer ratio of STEPS_PER_ARCSECOND for float-free conversions
+STEPS_PER_ARCSEC_NUM, STEPS_PER_ARCSEC_DEN = Fraction(STEPS_PER_ARCSECOND).limit_denominator(10000).as_integer_ratio()
+
+# Map the position file into memory so saving is a plain store
+def open_position_map():
+    fd = os.open(position_file, os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        new_file = os.fstat(fd).st_size < POSITION_SIZE
+        if new_file:
+            os.ftruncate(fd, POSITION_SIZE)
+        position_map = mmap.mmap(fd, POSITION_SIZE)
+    finally:
+        os.close(fd)
+
+    if new_file:
+        # Carry over the position from the old text file if there is one
+        try:
+            with open(legacy_position_file, "r") as f:
+                start = int(f.read().strip())
+        except (OSError, ValueError):
+            start = 0
+        struct.pack_into(POSITION_FORMAT, position_map, 0, start)
+        position_map.flush()
+    return position_map
 
-# Function to save the current position
-def save_position(position):
-    with open(position_file, "w") as f:
-        f.write(str(position))
+position_map = open_position_map()
+position_unsynced = False  # A save with sync=False is waiting for flush_position()
+
+# Function to save the current position (sync=False leaves write-back to the kernel)
+def save_position(position, sync=True):
+    global position_unsynced
+    struct.pack_into(POSITION_FORMAT, position_map, 0, position)
+    if sync:
+        position_map.flush()
+    position_unsynced = not sync
+
+# Function to push an unsynced position save to disk
+def flush_position():
+    global position_unsynced
+    if position_unsynced:
+        position_map.flush()
+        position_unsynced = False
 
 # Function to load the current position from the file
 def load_position():
-    if not os.path.exists(position_file):
-        save_position(0)  # Create the file with default position 0 if missing
-    try:
-        with open(position_file, "r") as f:
-            return int(f.read().strip())
-    except ValueError:
-        return 0  # Default position if file content is invalid
+    return struct.unpack_from(POSITION_FORMAT, position_map, 0)[0]
 
 current_position = load_position()
 
+def enable_realtime():
+    """Switch to SCHED_FIFO, pin to the isolated core and lock memory, where permitted"""
+    try:
+        os.sched_setscheduler(0, os.SCHED_FIFO, os.sched_param(RT_PRIORITY))
+        print(f"SCHED_FIFO priority {RT_PRIORITY} enabled")
+    except (OSError, AttributeError) as e:
+        print(f"Real-time priority unavailable, using default scheduler: {e}")
+    try:
+        os.sched_setaffinity(0, {RT_CPU})
+    except (OSError, AttributeError) as e:
+        print(f"Could not pin to CPU {RT_CPU}: {e}")
+    try:
+        libc = ctypes.CDLL("libc.so.6", use_errno=True)
+        if libc.mlockall(MCL_CURRENT_FUTURE) != 0:
+            print(f"mlockall failed: {os.strerror(ctypes.get_errno())}")
+    except OSError as e:
+        print(f"mlockall unavailable: {e}")
+
+def leave_realtime():
+    """Drop a helper thread back to the normal scheduler, off the real-time core"""
+    # Threads inherit SCHED_FIFO and the CPU pin from main(), only stepping should keep them
+    try:
+        os.sched_setscheduler(0, os.SCHED_OTHER, os.sched_param(0))
+        os.sched_setaffinity(0, set(range(os.cpu_count())) - {RT_CPU} or {RT_CPU})
+    except (OSError, AttributeError):
+        pass
+
 def setup_nunchuk():
     """Initialize the Nunchuk"""
     try:
+        # Blinka can't set the bus speed on Linux; for 400 kHz fast mode add
+        # dtparam=i2c_arm_baudrate=400000 to /boot/config.txt
         i2c = busio.I2C(board.SCL, board.SDA)
         nunchuk = Nunchuk(i2c)
         print("Nunchuk initialized successfully")
@@ -84,177 +187,364 @@ def setup_nunchuk():
         print(f"Failed to initialize Nunchuk: {e}")
         sys.exit(1)
 
-def move_motor(direction, speed, speed_half):
-    """Move motor based on joystick input using the same timing as manual mode"""
-    global current_position
-    
-    # Set direction with proper setup time
-    GPIO.output(DIR_PIN, GPIO.HIGH if direction > 0 else GPIO.LOW)
-    sleep(0.001)  # Reduced setup time
+# Latest nunchuk reading (joystick X offset, Z, C), replaced as a whole by the reader thread
+nunchuk_state = (0, False, False)
+nunchuk_event = threading.Event()  # Set whenever the published state changes
+nunchuk_active = threading.Event()  # Set while joystick mode needs readings, the reader idles otherwise
+joystick_center = 0  # Resting joystick X offset from the last calibration
 
-    # Use the EXACT SAME delay calculation as in move_steps
-    manual_base_delay = 0.001  # Same base delay as in move_steps
-    
-    if speed_half:
-        # Half speed - ensure it moves by limiting the maximum delay
-        # First calculate the delay as if it were full speed
-        full_speed_value = 0.1 + (speed * 0.9)  # Normal full speed calculation
-        delay = manual_base_delay / full_speed_value
-        
-        # Reduce multiplier for 1/4 microstepping to get more reasonable half-speed
-        delay = delay * 2  # Reduced from 3 to 2 for better motion with microstepping
-    else:
-        # Full speed - use full speed value with minimum (unchanged)
-        effective_speed = 0.1 + (speed * 0.9)  # Range: 0.1 to 1.0
-        delay = manual_base_delay / effective_speed
-
-    # Apply minimum/maximum delay constraints
-    min_manual_delay = 0.0002  # Increased from 0.0001 for more reliable operation
-    max_manual_delay = 0.02    # Reduced from 0.03 for better half-speed motion
-    
-    if delay < min_manual_delay:
-        delay = min_manual_delay
-    elif delay > max_manual_delay:
-        delay = max_manual_delay
+def nunchuk_worker(nunchuk):
+    """Sample the nunchuk in the background and publish the latest state"""
+    global nunchuk_state
+    leave_realtime()
+    history = collections.deque(maxlen=JOYSTICK_AVERAGE_SAMPLES)
+    failing = False  # Report a run of read errors once, not ten times a second
+    resumed = False
+    while True:
+        if not nunchuk_active.is_set():
+            # Nothing reads the nunchuk outside joystick mode, so leave the bus quiet
+            nunchuk_active.wait()
+            history.clear()
+            resumed = True  # Publish the first fresh reading even if it looks unchanged
+        try:
+            values = nunchuk.values  # One I2C read for joystick and buttons
+            x = values.joystick[0]
+            buttons = values.buttons
+        except OSError as e:
+            if not failing:
+                print(f"Nunchuk read error: {e}")
+                failing = True
+                # Publish a centred stick with no buttons, so the motor never runs on a stale reading
+                history.clear()
+                nunchuk_state = (joystick_center, False, False)
+                nunchuk_event.set()
+            sleep(0.1)
+            continue
+        if failing:
+            print("Nunchuk reads recovered")
+            failing = False
 
-    # Calculate pulse duration exactly like in move_steps
-    pulse_duration = delay / 2
-    
-    # For smoother operation with microstepping, reduce batch size to make movement more responsive
-    steps = 50  # Reduced from 100 for more responsive movement
-    
-    for _ in range(steps):
-        # Check position limit
-        if abs(current_position + direction) > MAX_STEPS:
+        history.append(x)
+        x_avg = sum(history) // len(history) - 128
+        state = (x_avg, buttons.Z, buttons.C)
+        if state != nunchuk_state or resumed:
+            nunchuk_state = state
+            resumed = False
+            nunchuk_event.set()
+        sleep(NUNCHUK_POLL_INTERVAL)
+
+def calibrate_joystick():
+    """Wake the nunchuk reader and average the resting joystick to find its centre offset"""
+    global joystick_center
+    nunchuk_event.clear()
+    nunchuk_active.set()
+    nunchuk_event.wait(timeout=0.5)  # First fresh reading
+    total = 0
+    for _ in range(CALIBRATION_SAMPLES):
+        total += nunchuk_state[0]
+        sleep(NUNCHUK_POLL_INTERVAL)
+    center = total // CALIBRATION_SAMPLES
+    if abs(center) > DEAD_ENTER:
+        # Too far off for a resting stick, it was most likely being held
+        print(f"Joystick not centred during calibration (offset {center}), using 0")
+        center = 0
+    joystick_center = center
+    return center
+
+def wait_button_release(index):
+    """Block until the button at nunchuk_state[index] is released"""
+    while nunchuk_state[index]:
+        nunchuk_event.wait(timeout=0.02)
+        nunchuk_event.clear()
+
+# Console lines are read by a background thread so main() never blocks in input()
+prompt_queue = queue.Queue()
+command_queue = queue.Queue()
+CONSOLE_POLL_INTERVAL = 0.05  # Housekeeping period while waiting for a command
+
+def console_worker():
+    """Show each prompt put on prompt_queue and hand the typed line to command_queue"""
+    leave_realtime()
+    while True:
+        prompt = prompt_queue.get()
+        try:
+            line = input(prompt)
+        except EOFError:
+            line = 'end'
+        command_queue.put(line)
+
+def ask(prompt):
+    """Prompt on the console and wait for the reply, doing housekeeping while idle"""
+    prompt_queue.put(prompt)
+    while True:
+        try:
+            return command_queue.get(timeout=CONSOLE_POLL_INTERVAL)
+        except queue.Empty:
+            flush_position()
+            disable_when_idle()
+
+def get_step_wave(high_us, low_us):
+    """Return a pigpio wave id for one STEP pulse, building each shape only once"""
+    key = (high_us, low_us)
+    wid = step_waves.get(key)
+    if wid is None:
+        pulses = [pigpio.pulse(STEP_MASK, 0, high_us),
+                  pigpio.pulse(0, STEP_MASK, low_us)]
+        pi.wave_add_generic(pulses)
+        try:
+            wid = pi.wave_create()
+        except pigpio.error:
+            # Out of DMA control blocks - drop the cached waves and rebuild
+            pi.wave_clear()
+            step_waves.clear()
+            pi.wave_add_generic(pulses)
+            wid = pi.wave_create()
+        step_waves[key] = wid
+    return wid
+
+def spin_until(deadline_ns):
+    """Wait until perf_counter_ns() reaches deadline_ns, sleeping only for the long part"""
+    remaining = deadline_ns - perf_counter_ns()
+    if remaining > SPIN_THRESHOLD_NS:
+        sleep((remaining - SPIN_THRESHOLD_NS) / 1e9)
+    while perf_counter_ns() < deadline_ns:
+        pass
+
+def send_step_wave(count, high_us, low_us):
+    """Emit count STEP pulses by looping a one-step wave with wave_chain, and wait for it
+
+    If Ctrl+C or SIGTERM ends the wait, the wave is stopped and the exception is
+    re-raised with a steps attribute holding how many pulses went out.
+    """
+    wid = get_step_wave(high_us, low_us)
+    period_ns = (high_us + low_us) * 1000
+    start = perf_counter_ns()
+    pi.wave_chain([255, 0, wid, 255, 1, count & 0xFF, count >> 8])
+    try:
+        # The chain length is known, so wait for it instead of polling every 5 ms
+        spin_until(start + count * period_ns)
+        while pi.wave_tx_busy():
+            pass
+    except (KeyboardInterrupt, SystemExit) as e:
+        # DMA keeps going without us, so stop it and work out how far it got
+        pi.wave_tx_stop()
+        e.steps = min(count, (perf_counter_ns() - start) // period_ns)
+        raise
+
+# Driver enable state, so ENABLE_PIN is only written (and waited on) when it changes
+driver_enabled = False
+last_motion_time = 0.0
+dir_level = 0  # Level last written to DIR_PIN
+
+def set_direction(direction):
+    """Point DIR_PIN at direction, returning True only if the pin actually changed"""
+    global dir_level
+    level = 1 if direction > 0 else 0
+    if level == dir_level:
+        return False
+    lgpio.gpio_write(gpio_chip, DIR_PIN, level)
+    dir_level = level
+    return True
+
+def set_enable(enabled):
+    """Switch the driver on or off, skipping the write and setup time if already there"""
+    global driver_enabled
+    if enabled != driver_enabled:
+        lgpio.gpio_write(gpio_chip, ENABLE_PIN, 1 if enabled else 0)
+        driver_enabled = enabled
+        if enabled:
+            sleep(0.001)  # Setup time after enabling
+
+def motion_done():
+    """Start the idle timer after a move"""
+    global last_motion_time
+    last_motion_time = monotonic()
+
+def disable_when_idle():
+    """Disable the driver once nothing has moved for ENABLE_IDLE_TIMEOUT seconds"""
+    if driver_enabled and monotonic() - last_motion_time > ENABLE_IDLE_TIMEOUT:
+        set_enable(False)
+
+def update_pwm_position():
+    """Add the steps emitted by the running STEP PWM since the last update"""
+    global current_position, pwm_steps_counted
+    if pwm_step_freq:
+        # Integer count from a fixed start, so rounding never accumulates
+        total = (monotonic_ns() - pwm_step_start_ns) * pwm_step_freq // 1_000_000_000
+        current_position += pwm_step_direction * (total - pwm_steps_counted)
+        pwm_steps_counted = total
+
+def stop_motor():
+    """Stop the STEP hardware PWM and bring current_position up to date"""
+    global pwm_step_freq, pwm_step_direction
+    if pwm_step_freq:
+        pi.hardware_PWM(STEP_PIN, 0, 0)
+        update_pwm_position()
+        pwm_step_freq = 0
+        pwm_step_direction = 0
+        # Hand the pin back to plain output mode for the wave generator
+        pi.set_mode(STEP_PIN, pigpio.OUTPUT)
+        pi.write(STEP_PIN, 0)
+
+def move_motor(direction, freq):
+    """Run the motor as a hardware PWM pulse train of freq Hz on STEP_PIN"""
+    global pwm_step_freq, pwm_step_direction, pwm_step_start_ns, pwm_steps_counted, limit_reported
+    update_pwm_position()
+
+    if direction != pwm_step_direction:
+        # Never reverse a running pulse train
+        stop_motor()
+
+        # Set direction with proper setup time, only needed when DIR really flips
+        if set_direction(direction):
+            sleep(0.001)  # Reduced setup time
+
+    # The pulse train runs on its own, so stop while there is still room before the limit
+    if MAX_STEPS - direction * current_position < freq * JOYSTICK_LIMIT_MARGIN:
+        stop_motor()
+        if not limit_reported:  # Called every poll while the stick is held against the limit
             print("Position limit reached!")
-            return
-            
-        # Generate step using EXACT SAME timing as move_steps
-        GPIO.output(STEP_PIN, GPIO.HIGH)
-        sleep(pulse_duration)  # Same as in move_steps
-        GPIO.output(STEP_PIN, GPIO.LOW)
-        sleep(pulse_duration)  # Same as in move_steps
-        
-        # Update position counter
-        current_position += direction
-
-def move_steps(steps, speed):
-    """Move a specific number of steps for manual input"""
+            limit_reported = True
+        return
+    limit_reported = False
+
+    if freq != pwm_step_freq:
+        if pwm_step_freq:
+            # Restart the count at the last whole step, keeping the fractional one
+            pwm_step_start_ns += pwm_steps_counted * 1_000_000_000 // pwm_step_freq
+        else:
+            pwm_step_start_ns = monotonic_ns()
+        pwm_steps_counted = 0
+        pi.hardware_PWM(STEP_PIN, freq, 500000)  # 50% duty cycle
+        pwm_step_freq = freq
+        pwm_step_direction = direction
+
+def make_joystick_mover(delay_multiplier):
+    """Build a (direction, deflection) joystick mover with its step rates precomputed"""
+    # Use the EXACT SAME base delay as in move_steps, so the step rate is
+    # (0.1 + 0.9 * speed) / (MANUAL_BASE_DELAY * delay_multiplier), with speed = deflection / 128
+    base_freq = 1 / (MANUAL_BASE_DELAY * delay_multiplier)
+    offset = 0.1 * base_freq
+    scale = 0.9 * base_freq
+    # Apply minimum/maximum delay constraints as frequency bounds
+    min_freq = 1 / JOYSTICK_MAX_DELAY
+    max_freq = 1 / JOYSTICK_MIN_DELAY
+    # The deflection is an integer, so every rate can be worked out once here
+    freqs = [int(round(min(max(offset + scale * deflection / 128, min_freq), max_freq)))
+             for deflection in range(JOYSTICK_LUT_SIZE)]
+
+    def move(direction, deflection):
+        move_motor(direction, freqs[min(deflection, JOYSTICK_LUT_SIZE - 1)])
+    return move
+
+move_motor_full = make_joystick_mover(1)
+# Reduce multiplier for 1/4 microstepping to get more reasonable half-speed
+move_motor_half = make_joystick_mover(2)  # Reduced from 3 to 2 for better motion with microstepping
+
+def move_steps(steps, speed, verbose=False):
+    """Move a specific number of steps, reporting progress every PROGRESS_STEPS if verbose"""
     global current_position
     step_direction = 1 if steps > 0 else -1
-    GPIO.output(DIR_PIN, GPIO.HIGH if step_direction > 0 else GPIO.LOW)
-
-    GPIO.output(ENABLE_PIN, GPIO.HIGH)
-    sleep(0.001)
+    if set_direction(step_direction):
+        sleep(0.001)  # DIR setup time, the driver may still be enabled from the last move
+    set_enable(True)
 
     # FASTER manual mode
-    manual_base_delay = 0.001  # Back to original value
-    delay = manual_base_delay / speed  # Original speed calculation
-    min_manual_delay = 0.0001  # Back to original value
-    if delay < min_manual_delay:
-        delay = min_manual_delay
-
-    pulse_duration = delay / 2
-    for _ in range(abs(steps)):
-        if abs(current_position + step_direction) > MAX_STEPS:
-            print("Position limit reached during manual move!")
-            break
-
-        GPIO.output(STEP_PIN, GPIO.HIGH)
-        sleep(pulse_duration)
-        GPIO.output(STEP_PIN, GPIO.LOW)
-        sleep(pulse_duration)
-        current_position += step_direction
-
-    GPIO.output(ENABLE_PIN, GPIO.LOW)
+    delay = MANUAL_BASE_DELAY / speed  # Original speed calculation
+    if delay < MANUAL_MIN_DELAY:
+        delay = MANUAL_MIN_DELAY
+
+    delay_us = max(int(delay * 1e6), 5)
+    high_us = STEP_PULSE_US  # Short fixed pulse, the rest of the period is spent low
+    # Track the position locally and store the global once the move ends
+    position = current_position
+    # Clip the move to the travel limit once, so the chunks need no bound check
+    total = abs(steps)
+    max_allowed = MAX_STEPS - step_direction * position
+    if total > max_allowed:
+        total = max(max_allowed, 0)
+        print("Position limit reached during manual move!")
+    remaining = total
+    chunk_limit = PROGRESS_STEPS if verbose else WAVE_CHUNK_STEPS
+    try:
+        while remaining > 0:
+            chunk = min(remaining, chunk_limit)
+            try:
+                send_step_wave(chunk, high_us, delay_us - high_us)
+            except (KeyboardInterrupt, SystemExit) as e:
+                position += step_direction * getattr(e, 'steps', 0)
+                raise
+            position += step_direction * chunk
+            remaining -= chunk
+            if verbose and remaining > 0:
+                print(f"Progress: {total - remaining}/{total} steps completed")
+    finally:
+        current_position = position
+        motion_done()
+
     save_position(current_position)
-    print(f"\nManual move finished. Final position: {current_position}")
 
 def reset_position():
     """Move motor to position 0 with slower speed"""
     global current_position
     
-    # Save the initial position to calculate steps correctly
-    initial_position = current_position
-    steps_to_zero = -initial_position
-    
-    if steps_to_zero == 0:
+    if current_position == 0:
         print("Motor is already at position 0.")
         return
     
-    print(f"Moving motor to position 0 ({abs(steps_to_zero)} steps)...")
-    steps_to_move = abs(steps_to_zero)
-    
-    # Use a fixed, reliable approach
-    GPIO.output(DIR_PIN, GPIO.HIGH if steps_to_zero > 0 else GPIO.LOW)
-    GPIO.output(ENABLE_PIN, GPIO.HIGH)
-    sleep(0.01)  # Short setup time
-    
-    # Simple, reliable parameters
-    delay = 0.002  # Fixed delay for reliable operation
-    step_direction = 1 if steps_to_zero > 0 else -1
-    
-    print("Starting move to position 0...")
-    
-    # Move in simple steps with fixed delay
-    for i in range(steps_to_move):
-        # Extra check to ensure we stop at exactly zero
-        if (step_direction > 0 and current_position >= 0) or (step_direction < 0 and current_position <= 0):
-            print(f"Reached or passed position 0! Current position: {current_position}")
-            break
-            
-        # Check position limit
-        if abs(current_position + step_direction) > MAX_STEPS:
-            print("Position limit reached during move to zero!")
-            break
-            
-        # Simple step generation
-        GPIO.output(STEP_PIN, GPIO.HIGH)
-        sleep(0.0001)  # Fixed pulse width
-        GPIO.output(STEP_PIN, GPIO.LOW)
-        sleep(delay)  # Fixed delay between steps
-        
-        # Update position
-        current_position += step_direction
-        
-        # Show progress occasionally
-        if i % 1000 == 0 and i > 0:
-            print(f"Homing progress: {i}/{steps_to_move} steps completed")
+    print(f"Moving motor to position 0 ({abs(current_position)} steps)...")
+    move_steps(-current_position, HOMING_SPEED, verbose=True)
     
     # Force position to be exactly zero to prevent drifting
     current_position = 0
-            
-    GPIO.output(ENABLE_PIN, GPIO.LOW)
     save_position(current_position)
     print("Motor is now at position 0.")
 
-# Convert arcminutes and arcseconds to steps
+# Convert an "arcmin.arcsec" string (e.g. "1.23" or "-0.5") to steps with integer math
 def arc_to_steps(arcmin_sec):
-    arcmin = int(abs(arcmin_sec))  # Extract arcminutes
-    arcsec = (abs(arcmin_sec) - arcmin) * 100  # Extract arcseconds
-    total_arcseconds = (arcmin * 60) + arcsec
-    steps = int(round(total_arcseconds * STEPS_PER_ARCSECOND))
-    return steps if arcmin_sec >= 0 else -steps  # Preserve direction
+    text = arcmin_sec.strip()
+    negative = text.startswith('-')
+    if text[:1] in ('+', '-'):
+        text = text[1:]  # At most one sign, like float()
+    arcmin_str, _, arcsec_str = text.partition('.')
+    if not (arcmin_str + arcsec_str).isdigit():
+        raise ValueError(f"could not convert '{arcmin_sec}' to arcmin.arcsec")
+    arcsec_str += '00'  # ".5" means 50 arcseconds
+
+    # Digits past the second decimal place are fractions of an arcsecond
+    scale = 10 ** (len(arcsec_str) - 2)
+    total = (int(arcmin_str or '0') * 60 * scale) + int(arcsec_str)  # In 1/scale arcseconds
+    num = total * STEPS_PER_ARCSEC_NUM
+    den = scale * STEPS_PER_ARCSEC_DEN
+    steps = (2 * num + den) // (2 * den)  # Round half up
+    return -steps if negative else steps  # Preserve direction
 
 # Convert steps to arcminutes and arcseconds
 def steps_to_arc(steps):
-    arcseconds = abs(steps) / STEPS_PER_ARCSECOND
-    arcminutes = int(arcseconds // 60)
-    arcseconds = arcseconds % 60
+    arcminutes, remainder = divmod(abs(steps) * STEPS_PER_ARCSEC_DEN, 60 * STEPS_PER_ARCSEC_NUM)
+    arcseconds = remainder / STEPS_PER_ARCSEC_NUM
     return arcminutes, arcseconds
 
+def handle_sigterm(signum, frame):
+    """Turn SIGTERM into SystemExit so main()'s cleanup stops the STEP pulses"""
+    sys.exit(0)
+
 def main():
     print("Initializing Wii Nunchuk Stepper Control...")
+    signal.signal(signal.SIGTERM, handle_sigterm)  # pigpiod keeps pulsing after we die otherwise
+    enable_realtime()
     nunchuk = setup_nunchuk()
+    threading.Thread(target=nunchuk_worker, args=(nunchuk,), daemon=True).start()
+    threading.Thread(target=console_worker, daemon=True).start()
     last_z_press_time = 0
     last_c_press_time = 0
     speed_half = False
+    move_joystick = move_motor_full
     global current_position
 
     try:
         while True:
-            GPIO.output(ENABLE_PIN, GPIO.LOW)
-            command_input = input(f"Current position: {current_position} (steps). Enter arcmin.arcsec (e.g., '1.23' for manual control, 'j' for joystick, 'gt0' or 'go to zero', 'reset' to reset position: ").strip().lower()
+            command_input = ask(f"Current position: {current_position} (steps). Enter arcmin.arcsec (e.g., '1.23' for manual control, 'j' for joystick, 'gt0' or 'go to zero', 'reset' to reset position: ").strip().lower()
 
             if command_input == 'end':
                 break
@@ -262,7 +552,7 @@ def main():
                 reset_position()
                 continue
             if command_input == 'reset':
-                reset_prompt = input("Are you sure you want to reset the current position to 0? (y/n): ").strip().lower()
+                reset_prompt = ask("Are you sure you want to reset the current position to 0? (y/n): ").strip().lower()
                 if reset_prompt == 'y':
                     current_position = 0
                     save_position(current_position)
@@ -274,98 +564,104 @@ def main():
             # Go back to the original non-threaded joystick control
             if command_input == 'j':
                 print("Entering Joystick Control Mode... Press Ctrl+C to exit.")
-                motor_enabled = False
+                motor_running = False
                 try:
+                    joystick_center = calibrate_joystick()
                     # Main joystick control loop
                     while True:
-                        x = nunchuk.joystick[0] - 128
-                        buttons = nunchuk.buttons
-                        z_button = buttons.Z
-                        c_button = buttons.C
+                        x, z_button, c_button = nunchuk_state
+                        x -= joystick_center
 
                         # Exit on Z+C press
                         if z_button and c_button:
                             print("\n*** Z+C buttons pressed - Exiting program ***")
-                            GPIO.output(ENABLE_PIN, GPIO.LOW)
-                            pwm.stop()
-                            GPIO.cleanup()
-                            save_position(current_position)
-                            sys.exit(0)
+                            sys.exit(0)  # Motor, GPIO and position are handled in the finally below
+
+                        # Stop before waiting for a button release, the PWM would run unchecked meanwhile
+                        if (z_button or c_button) and motor_running:
+                            stop_motor()
+                            motion_done()
+                            motor_running = False
+                            save_position(current_position, sync=False)
 
                         # Handle Z button (double-tap to reset)
                         if z_button:
-                            current_time = time()
+                            current_time = monotonic()
                             if last_z_press_time != 0 and (current_time - last_z_press_time) < 0.5:
                                 print("Double Tap Z Detected! Resetting position.")
-                                if motor_enabled:
-                                    GPIO.output(ENABLE_PIN, GPIO.LOW)
-                                    motor_enabled = False
+                                stop_motor()
+                                motor_running = False
                                 reset_position()
                                 last_z_press_time = 0
                             else:
                                 last_z_press_time = current_time
-                            while nunchuk.buttons.Z:
-                                sleep(0.01)
+                            wait_button_release(1)
                                 
                         # Handle C button (double-tap to toggle speed)
                         if c_button:
-                            current_time = time()
+                            current_time = monotonic()
                             if last_c_press_time != 0 and (current_time - last_c_press_time) < 0.5:
                                 speed_half = not speed_half
+                                move_joystick = move_motor_half if speed_half else move_motor_full
                                 print(f"Double Tap C Detected! Speed is now {'half' if speed_half else 'full'}")
                                 last_c_press_time = 0
                             else:
                                 last_c_press_time = current_time
-                            while nunchuk.buttons.C:
-                                sleep(0.01)
+                            wait_button_release(2)
                         
                         # Go back to simple, working joystick movement with your original move_motor
-                        if abs(x) < DEAD_ZONE:
-                            if motor_enabled:
-                                GPIO.output(ENABLE_PIN, GPIO.LOW)
-                                motor_enabled = False
-                                save_position(current_position)
-                            sleep(0.05)
+                        # Hysteresis: a running motor keeps going until the stick clearly settles
+                        if abs(x) < (DEAD_EXIT if motor_running else DEAD_ENTER):
+                            if motor_running:
+                                stop_motor()
+                                motion_done()
+                                motor_running = False
+                                save_position(current_position, sync=False)  # Just a store, ask() flushes it later
+                            disable_when_idle()
+                            # Sleep until the reader publishes something new
+                            nunchuk_event.wait(timeout=0.05)
+                            nunchuk_event.clear()
                         else:
-                            if not motor_enabled:
-                                GPIO.output(ENABLE_PIN, GPIO.HIGH) 
-                                motor_enabled = True
-                                sleep(0.001)
+                            if not motor_running:
+                                set_enable(True)
+                                motor_running = True
                             
                             direction = 1 if x > 0 else -1
-                            joystick_value = abs(x)
-                            normalized = joystick_value / 128.0
-                            speed = normalized
-                            move_motor(direction, speed, speed_half)
+                            move_joystick(direction, abs(x))
+                            sleep(JOYSTICK_POLL_INTERVAL)
                 
                 except KeyboardInterrupt:
                     print("\nExiting Joystick Control Mode...")
-                    if motor_enabled:
-                        GPIO.output(ENABLE_PIN, GPIO.LOW)
+                    stop_motor()
+                    motion_done()
+                    nunchuk_active.clear()
                     print(f"Exited Joystick mode. Current position: {current_position}")
                     continue
             try:
                 parts = command_input.split()
                 manual_speed_setting = 0.5
                 if len(parts) == 1:
-                    target_arcmin_sec = float(parts[0])
+                    target_arcmin_sec = parts[0]
                 elif len(parts) == 2 and parts[0] in ['s', 'slow']:
                     manual_speed_setting = 0.1
-                    target_arcmin_sec = float(parts[1])
+                    target_arcmin_sec = parts[1]
                 else:
                     raise ValueError("Invalid command format")
                 steps_to_move = arc_to_steps(target_arcmin_sec)
                 print(f"Manual command: Move {steps_to_move} steps at speed setting {manual_speed_setting}")
                 move_steps(steps_to_move, manual_speed_setting)
+                print(f"\nManual move finished. Final position: {current_position}")
             except ValueError as e:
                 print(f"Invalid input: {e}. Please enter a valid command format.")
                 continue
     except KeyboardInterrupt:
         print("\nProgram interrupted by user")
     finally:
-        GPIO.output(ENABLE_PIN, GPIO.LOW)
-        pwm.stop()
-        GPIO.cleanup()
+        stop_motor()
+        pi.wave_tx_stop()
+        set_enable(False)
+        lgpio.gpiochip_close(gpio_chip)
+        pi.stop()
         save_position(current_position)
         print("Motor disabled, GPIO cleaned up.")
 
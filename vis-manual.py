@@ -1,11 +1,13 @@
-from gpiozero import OutputDevice
+import lgpio
 from time import sleep
 import os
 import threading
 import board
 import busio
 from adafruit_nunchuk import Nunchuk
+import pigpio
 import queue
+import sys
 import time
 
 # Ensure the stepper_data directory exists
@@ -27,18 +29,28 @@ MODE_PIN_1 = 16
 MODE_PIN_2 = 17
 MODE_PIN_3 = 20
 
-# Set up GPIO
-dir_pin = OutputDevice(DIR_PIN)
-step_pin = OutputDevice(STEP_PIN)
-enable_pin = OutputDevice(ENABLE_PIN)
-mode_pin_1 = OutputDevice(MODE_PIN_1)
-mode_pin_2 = OutputDevice(MODE_PIN_2)
-mode_pin_3 = OutputDevice(MODE_PIN_3)
+# Set up GPIO through the gpiochip character device (STEP_PIN is driven by pigpio waves below)
+gpio_chip = lgpio.gpiochip_open(0)
+lgpio.gpio_claim_output(gpio_chip, DIR_PIN, 0)
+lgpio.gpio_claim_output(gpio_chip, ENABLE_PIN, 0)
 
-# Set mode pins for 1/32 microstepping
-mode_pin_1.on()
-mode_pin_2.on()
-mode_pin_3.on()
+# Set mode pins for 1/32 microstepping, all three in one request
+MODE_THIRTY_SECOND = [1, 1, 1]
+lgpio.group_claim_output(gpio_chip, [MODE_PIN_1, MODE_PIN_2, MODE_PIN_3], MODE_THIRTY_SECOND)
+
+# pigpio daemon connection, STEP pulses are timed by its DMA wave generator
+pi = pigpio.pi()
+if not pi.connected:
+    print("Failed to connect to pigpio daemon (is pigpiod running?)")
+    lgpio.gpiochip_close(gpio_chip)
+    sys.exit(1)
+pi.set_mode(STEP_PIN, pigpio.OUTPUT)
+pi.wave_clear()
+STEP_MASK = 1 << STEP_PIN
+STEP_HIGH_US = 200     # STEP high time
+STEP_LOW_US = 200      # Minimum STEP low time, the speed delay is added to it
+SAVE_INTERVAL = 1000   # Steps between position saves
+step_waves = {}        # low_us -> prebuilt single-step wave id
 
 current_position = 0  # Global position tracking
 
@@ -53,25 +65,53 @@ def initialize_nunchuk():
         return False
 
 def save_position(position):
-    with open(position_file, "w") as f:
+    # Write a temporary file and rename it over the old one, so a crash never leaves it half written
+    tmp_file = position_file + ".tmp"
+    with open(tmp_file, "w") as f:
         f.write(str(position))
+    os.replace(tmp_file, position_file)
 
 def load_position():
-    if not os.path.exists(position_file):
-        save_position(0)
+    # A missing file is position 0, it gets written by the first save after a move
     try:
-        with open(position_file, "r") as f:
-            return int(f.read().strip())
-    except ValueError:
+        with open(position_file, "rb") as f:
+            return int(f.read(20))
+    except (FileNotFoundError, ValueError):
         return 0
 
+def get_step_wave(low_us):
+    # One STEP pulse as a pigpio wave, each shape is built only once
+    wid = step_waves.get(low_us)
+    if wid is None:
+        pulses = [pigpio.pulse(STEP_MASK, 0, STEP_HIGH_US),
+                  pigpio.pulse(0, STEP_MASK, low_us)]
+        pi.wave_add_generic(pulses)
+        try:
+            wid = pi.wave_create()
+        except pigpio.error:
+            # Out of DMA control blocks - drop the cached waves and rebuild
+            pi.wave_clear()
+            step_waves.clear()
+            pi.wave_add_generic(pulses)
+            wid = pi.wave_create()
+        step_waves[low_us] = wid
+    return wid
+
+def send_steps(count, low_us):
+    # Loop the one-step wave count times (count <= 65535) and wait for it to finish
+    wid = get_step_wave(low_us)
+    pi.wave_chain([255, 0, wid, 255, 1, count & 0xFF, count >> 8])
+    sleep(count * (STEP_HIGH_US + low_us) / 1e6)
+    while pi.wave_tx_busy():
+        sleep(0.001)
+
 def move_steps(steps, delay, soft_start_end=False):
     global current_position
     step_direction = 1 if steps > 0 else -1
-    dir_pin.on() if step_direction > 0 else dir_pin.off()
+    lgpio.gpio_write(gpio_chip, DIR_PIN, 1 if step_direction > 0 else 0)
     sleep(0.005)  # Keep 5ms setup time
     
-    enable_pin.on()
+    lgpio.gpio_write(gpio_chip, ENABLE_PIN, 1)
     sleep(0.005)
     
     # More dramatic speed calculation based on joystick position
@@ -80,22 +120,20 @@ def move_steps(steps, delay, soft_start_end=False):
     max_delay = 0.002    # 2000 microseconds near center
     adjusted_delay = max_delay * (1 - speed_factor)  # Inverse relationship
     
-    # Normal stepping with speed-based timing
-    for step_count in range(abs(steps)):
-        if not (-MAX_STEPS <= current_position + step_direction <= MAX_STEPS):
-            print("Movement limit reached. Stopping.")
-            break
-            
-        step_pin.on()
-        sleep(0.0002)
-        step_pin.off()
-        sleep(0.0002)
-        sleep(adjusted_delay)  # Variable speed delay
-        
-        current_position += step_direction
-        
-        if abs(current_position) % 1000 == 0:
-            save_position(current_position)
+    low_us = STEP_LOW_US + int(adjusted_delay * 1e6)  # Variable speed delay
+    
+    # Clip to the movement limit up front instead of checking every step
+    remaining = min(abs(steps), MAX_STEPS - step_direction * current_position)
+    if remaining < abs(steps):
+        print("Movement limit reached. Stopping.")
+    
+    # Normal stepping with speed-based timing, saving every SAVE_INTERVAL steps
+    while remaining > 0:
+        chunk = min(remaining, SAVE_INTERVAL)
+        send_steps(chunk, low_us)
+        current_position += step_direction * chunk
+        remaining -= chunk
+        save_position(current_position)
 
 def nunchuk_control():
     global nc, current_position
@@ -161,5 +199,8 @@ try:
 except KeyboardInterrupt:
     print("\nProgram interrupted by user.")
 finally:
-    enable_pin.off()  # Ensure motor is disabled on exit
+    pi.wave_tx_stop()
+    lgpio.gpio_write(gpio_chip, ENABLE_PIN, 0)  # Ensure motor is disabled on exit
+    lgpio.gpiochip_close(gpio_chip)
+    pi.stop()
     print("Stepper motor driver disabled.")
\ No newline at end of file
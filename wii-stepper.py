@@ -1,16 +1,24 @@
-from gpiozero import OutputDevice
-from time import sleep
+import lgpio
+from time import sleep, monotonic
 import os
 import board
 import busio
 from adafruit_nunchuk import Nunchuk
+import pigpio
 import sys
+import threading
+import ctypes
 
 # Motor constants and GPIO setup (same as original for consistency)
 STEPS_PER_REV = 8000    # 1/32 microstepping
 MAX_STEPS = 132000      # Limit
 DEAD_ZONE = 30          # Joystick dead zone
 
+# Real-time scheduling (needs root; best with kernel cmdline "isolcpus=3")
+RT_PRIORITY = 80  # SCHED_FIFO priority
+RT_CPU = 3        # Isolated core for the main loop
+MCL_CURRENT_FUTURE = 3  # mlockall(MCL_CURRENT | MCL_FUTURE)
+
 # GPIO pins
 DIR_PIN = 13
 STEP_PIN = 19
@@ -19,18 +27,46 @@ MODE_PIN_1 = 16
 MODE_PIN_2 = 17
 MODE_PIN_3 = 20
 
-# Set up GPIO
-dir_pin = OutputDevice(DIR_PIN)
-step_pin = OutputDevice(STEP_PIN)
-enable_pin = OutputDevice(ENABLE_PIN)
-mode_pin_1 = OutputDevice(MODE_PIN_1)
-mode_pin_2 = OutputDevice(MODE_PIN_2)
-mode_pin_3 = OutputDevice(MODE_PIN_3)
+# Set up GPIO through the gpiochip character device (STEP_PIN is driven by pigpio waves below)
+gpio_chip = lgpio.gpiochip_open(0)
+lgpio.gpio_claim_output(gpio_chip, DIR_PIN, 0)
+lgpio.gpio_claim_output(gpio_chip, ENABLE_PIN, 0)
+
+# Set 1/32 microstepping mode, all three in one request
+MODE_THIRTY_SECOND = [1, 1, 1]
+lgpio.group_claim_output(gpio_chip, [MODE_PIN_1, MODE_PIN_2, MODE_PIN_3], MODE_THIRTY_SECOND)
 
-# Set 1/32 microstepping mode
-mode_pin_1.on()
-mode_pin_2.on()
-mode_pin_3.on()
+# pigpio daemon connection, STEP pulses are timed by its DMA wave generator
+pi = pigpio.pi()
+if not pi.connected:
+    print("Failed to connect to pigpio daemon (is pigpiod running?)")
+    lgpio.gpiochip_close(gpio_chip)
+    sys.exit(1)
+pi.set_mode(STEP_PIN, pigpio.OUTPUT)
+pi.wave_clear()
+STEP_MASK = 1 << STEP_PIN
+STEP_HIGH_US = 300   # 300 microseconds ON
+STEP_LOW_US = 600    # 300 microseconds OFF plus 300 between steps
+RAMP_STEPS = 40      # Steps to speed up from rest and to slow down on release
+RAMP_START_LOW_US = 2700  # STEP low time at the slow end of a ramp
+SETUP_US = 5000      # DIR/ENABLE setup time before the first STEP pulse
+
+def enable_realtime():
+    """Switch to SCHED_FIFO, pin to the isolated core and lock memory, where permitted"""
+    try:
+        os.sched_setscheduler(0, os.SCHED_FIFO, os.sched_param(RT_PRIORITY))
+    except (OSError, AttributeError) as e:
+        print(f"Real-time priority unavailable, using default scheduler: {e}")
+    try:
+        os.sched_setaffinity(0, {RT_CPU})
+    except (OSError, AttributeError) as e:
+        print(f"Could not pin to CPU {RT_CPU}: {e}")
+    try:
+        libc = ctypes.CDLL("libc.so.6", use_errno=True)
+        if libc.mlockall(MCL_CURRENT_FUTURE) != 0:
+            print(f"mlockall failed: {os.strerror(ctypes.get_errno())}")
+    except OSError as e:
+        print(f"mlockall unavailable: {e}")
 
 def setup_nunchuk():
     """Initialize the Nunchuk"""
@@ -43,58 +79,190 @@ def setup_nunchuk():
         print(f"Failed to initialize Nunchuk: {e}")
         sys.exit(1)
 
-def move_motor(direction, speed, nunchuk):
-    """Move motor based on joystick input with manual control timing"""
-    # Set direction with proper setup time
-    dir_pin.on() if direction > 0 else dir_pin.off()
-    sleep(0.005)  # Keep 5ms setup time
-    
-    # Enable motor
-    enable_pin.on()
-    sleep(0.005)  # Setup time for enable
+def burst_steps(raw_x):
+    """Signed number of steps to move for a raw joystick byte, 0 inside the dead zone"""
+    x = raw_x - 128
+    if abs(x) < DEAD_ZONE:
+        return 0
+    speed = abs(x) / 128.0  # Simple linear scaling
     
     # Adjusted step calculation for smoother motion
     base_steps = 150    # Increased base steps
     max_steps = 450     # Reduced max steps for better control
     steps = max(100, int(base_steps + (speed * max_steps)))  # Higher minimum steps
+    return steps if x > 0 else -steps
+
+# The joystick reports one byte, so work out the burst for every value up front
+JOYSTICK_STEPS = [burst_steps(raw_x) for raw_x in range(256)]
+
+def create_step_wave(low_times):
+    """Build a pigpio wave with one STEP pulse per low time"""
+    pulses = []
+    for low_us in low_times:
+        pulses.append(pigpio.pulse(STEP_MASK, 0, STEP_HIGH_US))
+        pulses.append(pigpio.pulse(0, STEP_MASK, low_us))
+    pi.wave_add_generic(pulses)
+    return pi.wave_create()
+
+# Linear ramp of the low time between RAMP_START_LOW_US and STEP_LOW_US
+ramp_low_times = [RAMP_START_LOW_US - (RAMP_START_LOW_US - STEP_LOW_US) * i // (RAMP_STEPS - 1)
+                  for i in range(RAMP_STEPS)]
+ramp_up_wave = create_step_wave(ramp_low_times)
+ramp_down_wave = create_step_wave(ramp_low_times[::-1])
+
+# One STEP pulse as a pigpio wave, looped by wave_chain for the cruise part of each burst
+step_wave = create_step_wave([STEP_LOW_US])
+
+# A pin-less delay, sent ahead of a burst after DIR or ENABLE changes
+pi.wave_add_generic([pigpio.pulse(0, 0, SETUP_US)])
+setup_wave = pi.wave_create()
+
+RAMP_TIME = (RAMP_STEPS * STEP_HIGH_US + sum(ramp_low_times)) / 1e6  # Seconds per ramp
+
+def burst_chain(steps, from_rest):
+    """wave_chain command for a burst: ramp up first if starting from rest, then cruise"""
+    if from_rest:
+        cruise = steps - RAMP_STEPS
+        return [ramp_up_wave, 255, 0, step_wave, 255, 1, cruise & 0xFF, cruise >> 8]
+    return [255, 0, step_wave, 255, 1, steps & 0xFF, steps >> 8]
+
+def burst_time(steps, from_rest):
+    """Seconds the DMA wave generator takes to send a burst"""
+    if from_rest:
+        return RAMP_TIME + (steps - RAMP_STEPS) * (STEP_HIGH_US + STEP_LOW_US) / 1e6
+    return steps * (STEP_HIGH_US + STEP_LOW_US) / 1e6
+
+# Every burst as a first burst from rest and as a continuation at cruise speed
+BURST_CHAINS = {(abs(steps), from_rest): burst_chain(abs(steps), from_rest)
+                for steps in JOYSTICK_STEPS if steps for from_rest in (True, False)}
+BURST_TIMES = {key: burst_time(*key) for key in BURST_CHAINS}
+
+# Latest raw joystick byte, published by the poller thread
+joystick_x = 128
+joystick_active = threading.Event()  # Set while the stick is outside the dead zone
+joystick_idle = threading.Event()    # Set while the stick is inside the dead zone
+joystick_idle.set()
+NUNCHUK_POLL_INTERVAL = 0.01
+
+def poll_nunchuk(nunchuk):
+    """Read the joystick in the background so main only wakes up for real input"""
+    global joystick_x
+    failing = False  # Report a run of read errors once, not every poll
+    while True:
+        try:
+            joystick_x = nunchuk.joystick[0]
+        except OSError as e:
+            if not failing:
+                print(f"Nunchuk read error: {e}")
+                failing = True
+            # Treat a failed read as a centred stick, so main never keeps moving on a stale value
+            joystick_x = 128
+            joystick_active.clear()
+            joystick_idle.set()
+            sleep(0.1)
+            continue
+        if failing:
+            print("Nunchuk reads recovered")
+            failing = False
+        if JOYSTICK_STEPS[joystick_x]:
+            joystick_idle.clear()
+            joystick_active.set()
+        else:
+            joystick_active.clear()
+            joystick_idle.set()
+        sleep(NUNCHUK_POLL_INTERVAL)
+
+# Driver state, so DIR and ENABLE are only written (and waited on) when they change
+last_direction = 0
+driver_enabled = False
+cruising = False  # The last burst ran to the end, so the motor is still at cruise speed
+ENABLE_IDLE_TIMEOUT = 0.5  # Disable the driver after this long in the dead zone
+
+def ramp_down():
+    """Slow the motor from cruise speed to a stop"""
+    global cruising
+    pi.wave_send_once(ramp_down_wave)
+    while pi.wave_tx_busy():
+        sleep(0.001)
+    cruising = False
+
+def move_motor(steps):
+    """Move motor based on joystick input with manual control timing"""
+    global last_direction, driver_enabled, cruising
+    direction = 1 if steps > 0 else -1
+    setup = False
+    if direction != last_direction:
+        # Set direction
+        lgpio.gpio_write(gpio_chip, DIR_PIN, 1 if direction > 0 else 0)
+        last_direction = direction
+        setup = True
+    
+    if not driver_enabled:
+        # Enable motor
+        lgpio.gpio_write(gpio_chip, ENABLE_PIN, 1)
+        driver_enabled = True
+        setup = True
+    
+    # Only ramp up from rest, back-to-back bursts carry on at cruise speed
+    from_rest = setup or not cruising
+    chain = BURST_CHAINS[abs(steps), from_rest]
+    duration = BURST_TIMES[abs(steps), from_rest]
+    ramp_end = RAMP_TIME if from_rest else 0  # When the burst reaches cruise speed
+    
+    if setup:
+        # Let the DMA wave generator time the setup instead of sleeping for it
+        chain = [setup_wave] + chain
+        duration += SETUP_US / 1e6
+        ramp_end += SETUP_US / 1e6
     
-    # Modified timing for smoother operation
-    for _ in range(steps):
-        step_pin.on()
-        sleep(0.0003)  # Increased to 300 microseconds ON
-        step_pin.off()
-        sleep(0.0003)  # Increased to 300 microseconds OFF
-        sleep(0.0003)  # Increased delay between steps
-        
-        # Check dead zone
-        if abs(nunchuk.joystick[0] - 128) < DEAD_ZONE:
-            break
+    # Hand the whole burst to the DMA wave generator as a prebuilt chain
+    start = monotonic()
+    pi.wave_chain(chain)
+    
+    # Sleep until the burst should be done, waking early to cut it short on release
+    if joystick_idle.wait(timeout=duration):
+        pi.wave_tx_stop()
+        cruising = False
+        if monotonic() - start >= ramp_end:
+            ramp_down()  # Released at cruise speed, so slow down instead of stopping dead
+        return
+    while pi.wave_tx_busy():
+        sleep(0.001)
+    cruising = True
 
 def main():
+    global driver_enabled
     print("Initializing Wii Nunchuk Stepper Control...")
     nunchuk = setup_nunchuk()
-    last_direction = 0
+    threading.Thread(target=poll_nunchuk, args=(nunchuk,), daemon=True).start()
+    enable_realtime()  # After starting the poller, so it keeps the normal scheduler
     
     try:
         while True:
-            x = nunchuk.joystick[0] - 128
+            if cruising and not joystick_active.is_set():
+                ramp_down()  # Released between two bursts
             
-            if abs(x) < DEAD_ZONE:
-                sleep(0.01)
+            # Block until the stick leaves the dead zone, disabling the driver if it stays idle
+            if not joystick_active.wait(timeout=ENABLE_IDLE_TIMEOUT if driver_enabled else None):
+                lgpio.gpio_write(gpio_chip, ENABLE_PIN, 0)
+                driver_enabled = False
+                continue
+            steps = JOYSTICK_STEPS[joystick_x]
+            if not steps:
                 continue
-            
-            direction = 1 if x > 0 else -1
-            speed = abs(x) / 128.0  # Simple linear scaling
             
             # Move motor with current settings
-            move_motor(direction, speed, nunchuk)
+            move_motor(steps)
             
             # No extra delay between movements
             
     except KeyboardInterrupt:
         print("\nProgram interrupted by user")
     finally:
-        enable_pin.off()
+        pi.wave_tx_stop()
+        lgpio.gpio_write(gpio_chip, ENABLE_PIN, 0)
+        lgpio.gpiochip_close(gpio_chip)
+        pi.stop()
         print("Motor disabled")
 
 if __name__ == "__main__":